@@ -20,14 +20,25 @@ import glob
 import sys
 import os
 import platform
-import ansi2html
 import configparser
+import html
+import re
 import dataclasses
+import functools
 import shlex
 import traceback
 
+from string import Template
 from typing import Iterable, Callable
 
+# The ansi2html module is optional. Reports are converted to HTML by
+# iter_ansi_to_html(), and ansi2html is only used when asked for with the
+# :ansi2html option of print_result.
+try:
+	import ansi2html # type: ignore
+except ImportError:
+	ansi2html = None
+
 # This checks whether the system is a Windows system. If it is, we need to sort
 # out the console so that we can display ANSI escape codes. If there if an
 # error, the user will be informed and the program will exit immediately.
@@ -42,7 +53,10 @@ if platform.system() == "Windows":
 		exit(-1)
 
 # This section describes the global variables for the program. PERSONS is the
-# complete list of all the persons in the database. COLOR is a configuration
+# complete list of all the persons in the database, and PERSONS_BY_ID,
+# CHILDREN_OF and SIBLINGS_OF are indexes over it (by ID, from a parent's ID to
+# the IDs of their children, and from a set of parents to the IDs of all of
+# their children) which are built when a file is loaded. COLOR is a configuration
 # variable which describes whether color is turned on. It has been abandoned;
 # why wouldn't you want color? CLI is a reference to the current instance of
 # CommandLineInterface(). LINEBREAKS describes a deprecated feature of whether
@@ -51,6 +65,9 @@ if platform.system() == "Windows":
 # to the active filename. Ideally, we would move everything into CLI, but this
 # might be too much of a reform.
 PERSONS			: list					= []
+PERSONS_BY_ID	: dict					= {}
+CHILDREN_OF		: dict					= {}
+SIBLINGS_OF		: dict					= {}
 COLOR			: bool					= True	# type: deprecated
 CLI										= None
 LINEBREAKS		: bool					= False	# type: deprecated
@@ -59,9 +76,10 @@ FILENAME		: str					= None
 
 # This section contains some text templates and constants. WELCOMETEXT and
 # COPYRIGHT provide the welcome to the program. STANDALONEHTML and HTML provide
-# HTML template documents that are used to print reports, after the usage of the
-# ansi2html formatter. STANDALONEHTML is used with the :standalone option, while
-# HTML is used with the :inline option.
+# HTML template documents that are used to print reports, after they have been
+# converted to HTML. STANDALONEHTML is used with the :standalone option, while
+# HTML is used with the :inline option. They are string.Template templates, as
+# the braces in the CSS rule out str.format().
 
 WELCOMETEXT		= """
 Welcome to GTREE version 1.30.
@@ -78,7 +96,7 @@ STANDALONEHTML			= """
 <!DOCTYPE html>
 <html>
 	<head>
-		<title>GTREE: {FamilyTreeName}</title>
+		<title>GTREE: ${FamilyTreeName}</title>
 		<meta charset="utf-8">
 		<style>
 			._gtree_private_css_tag_tree, ._gtree_private_css_tag_tree span {
@@ -97,9 +115,9 @@ STANDALONEHTML			= """
 		</style>
 	</head>
 	<body>
-		<h3 class="_gtree_private_css_tag_header">{Title}</h3>
+		<h3 class="_gtree_private_css_tag_header">${Title}</h3>
 		<p>
-			<div class="_gtree_private_css_tag_tree">{Data}</div>
+			<div class="_gtree_private_css_tag_tree">${Data}</div>
 		</p>
 		<p>Generated by GTREE (<a href="https://wood.eu.com/gtree" class="lnk">https://wood.eu.com/gtree</a>)</p>
 	</body>
@@ -122,9 +140,9 @@ HTML	= """
 		font-style:		italic;
 	}
 </style>
-<h3 class="_gtree_private_css_tag_header">{Title}</h3>
+<h3 class="_gtree_private_css_tag_header">${Title}</h3>
 <p>
-	<div class="_gtree_private_css_tag_tree">{Data}</div>
+	<div class="_gtree_private_css_tag_tree">${Data}</div>
 </p>
 <p>Generated by GTREE (<a href="https://wood.eu.com/gtree" class="lnk">https://wood.eu.com/gtree</a>)</p>
 """
@@ -172,47 +190,43 @@ class Graphics:
 			CYAN		= "\033[46m"
 			WHITE		= "\033[47m"
 			DEFAULT		= "\033[49m"
+	@dataclasses.dataclass(frozen=True)
 	class LineDrawing:
-		def __init__(self, color, ascii=False):
-			if not ascii:
-				self.ITEMS = {
-					"PIPE"	: "│  ",
-					"ELBOW"	: "└──",
-					"TEE"	: "├──",
-					"BLANK"	: "   "
-				}
-			else:
-				self.ITEMS = {
-					"PIPE"	: "|  ",
-					"ELBOW"	: "`--",
-					"TEE"	: "|--",
-					"BLANK"	: "   "
-				}
-			self.color = color
-			self.colorise()
-		
-		def colorise(self):
-			for each in self.ITEMS.keys():
-				setattr(
-					self,
-					each,
-					(
-						self.color
-						+ self.ITEMS[each]
-						+ "\033[39m"
-					)
-				)
+		PIPE:	str
+		ELBOW:	str
+		TEE:	str
+		BLANK:	str
+
+		UNICODE	= {
+			"PIPE"	: "│  ",
+			"ELBOW"	: "└──",
+			"TEE"	: "├──",
+			"BLANK"	: "   "
+		}
+		ASCII	= {
+			"PIPE"	: "|  ",
+			"ELBOW"	: "`--",
+			"TEE"	: "|--",
+			"BLANK"	: "   "
+		}
+
+		# Builds the set of glyphs once, with the color applied to each.
+		@classmethod
+		def colorised(cls, color, ascii=False):
+			return cls(**{
+				name: f"{color}{glyph}\033[39m"
+				for name, glyph in (cls.ASCII if ascii else cls.UNICODE).items()
+			})
 
 # The diag() function performs a simple job of printing text to the output,
 # ensuring it is indented by the magic value of 19 spaces. There was a reason
-# why this number was chosen; I cannot remember it.
+# why this number was chosen; I cannot remember it. The text is written with a
+# single call, as diag() is also used for long outputs such as trees.
 def diag(string, end="\n", file=sys.stdout):
-	for line in str(string).split("\n"):
-		if line.strip() == "":
-			file.write(end)
-			continue
-		file.write((" "*19)+line+end)
-	
+	file.write("".join([
+		("" if line.strip() == "" else (" "*19) + line) + end
+		for line in str(string).split("\n")
+	]))
 	file.flush()
 
 # MARK: Utilities
@@ -352,16 +366,18 @@ def get_bool(string: str):
 	else:
 		return False
 
+# Genders are stored as an index into _GENDER_NAMES, and are resolved from the
+# first letter of the value given in the file.
+_GENDER_NAMES	= ("Unknown", "Male", "Female")
+_GENDER_CODES	= {"m": 1, "f": 2}
+
 def resolve_gender(gender: str):
-	gender = gender.lower().strip()
-	if gender.startswith("m"):		return 1
-	elif gender.startswith("f"):	return 2
-	else:							return 0
+	return _GENDER_CODES.get(gender.strip()[:1].lower(), 0)
 
 def get_gender(gender: int):
-	if gender == 1:	return "Male"
-	if gender == 2: return "Female"
-	else:			return "Unknown"
+	if 0 <= gender < len(_GENDER_NAMES):
+		return _GENDER_NAMES[gender]
+	return _GENDER_NAMES[0]
 
 def resolve_globs(path: str):
 	result = glob.glob(path)
@@ -382,8 +398,8 @@ def table_format(persons: list):
 		"Gender",
 		"ID"
 	)
-	for person in persons:
-		output += FMT.format(
+	rows = [
+		FMT.format(
 			person.title,
 			person.first_name,
 			person.middle_name,
@@ -393,38 +409,134 @@ def table_format(persons: list):
 			get_gender(person.gender),
 			person.id
 		)
-	output = output[0:-1]
+		for person in persons
+	]
+	output = "".join([output, *rows])[0:-1]
 	return output
 
 # Return the actual length of a string, ignoring ANSI escapes, non-printable
-# characters, and taking into account newlines, and tabs (for example).
-def actuallen(string: str):
-	length		= 0
-	skipping	= False
-	for each in string:
-		if skipping:
-			if each.isalpha():
-				skipping	= False
-			continue
+# characters, and taking into account newlines, and tabs (for example). An
+# escape is skipped up to and including the first letter (by str.isalpha())
+# that follows it. For ASCII strings that is exactly what _ANSI_RE matches;
+# other strings are walked escape by escape.
+_ANSI_RE	= re.compile("\033[^A-Za-z]*[A-Za-z]?")
+
+def _strip_escapes(string: str):
+	if string.isascii():
+		return _ANSI_RE.sub("", string)
+
+	parts	= []
+	start	= 0
+	while True:
+		index	= string.find("\033", start)
+		if index == -1:
+			parts.append(string[start:])
+			return "".join(parts)
+
+		parts.append(string[start:index])
+		start	= index + 1
+		while start < len(string) and not string[start].isalpha():
+			start += 1
+		start += 1
 
-		if each == '\033':
-			skipping	= True
-			continue
+def actuallen(string: str):
+	string	= _strip_escapes(string)
+	if string.isprintable():
+		return len(string)
 
-		if not each.isprintable(): continue
-		if (
-			each == "\r"
-			or each == "\n"
-			or each == "\f"
-			or each == "\v"
-		): continue
+	length	= 0
+	for each in string:
 		if each == "\t":
 			length += 8
-			continue
-		length += 1
-	
+		elif each.isprintable():
+			length += 1
+
 	return length
 
+# Converts text with ANSI escapes to HTML, for printing reports. Only the SGR
+# codes that GTREE itself produces are styled; any other escape is dropped. On
+# every change of style (a run of adjacent escapes counts as one change), the
+# open span is closed and a new one is opened with the complete current style,
+# so the spans are always balanced. The colors are those of the 'mint-terminal'
+# scheme of ansi2html, on a light background.
+_SGR_RE		= re.compile("\033\\[([0-9;]*)([A-Za-z])")
+_SGR_RUN_RE	= re.compile("(?:\033\\[[0-9;]*[A-Za-z])+")
+_SGR_COLORS	= (
+	"#2e3436", "#cc0000", "#4e9a06", "#c4a000",
+	"#3465a4", "#75507b", "#06989a", "#d3d7cf",
+	"#555753", "#ef2929", "#8ae234", "#fce94f",
+	"#729fcf", "#ad7fa8", "#34e2e2", "#eeeeec"
+)
+_SGR_DEFAULTS	= {
+	"fg":		None,
+	"bg":		None,
+	"bold":		False,
+	"italic":	False,
+	"inverse":	False
+}
+_SGR_SETTINGS	= {
+	0:	_SGR_DEFAULTS,
+	1:	{"bold":	True},
+	3:	{"italic":	True},
+	7:	{"inverse":	True},
+	22:	{"bold":	False},
+	23:	{"italic":	False},
+	27:	{"inverse":	False},
+	39:	{"fg":		None},
+	49:	{"bg":		None},
+	**{30 + i:	{"fg": _SGR_COLORS[i]}		for i in range(8)},
+	**{40 + i:	{"bg": _SGR_COLORS[i]}		for i in range(8)},
+	**{90 + i:	{"fg": _SGR_COLORS[8 + i]}	for i in range(8)},
+	**{100 + i:	{"bg": _SGR_COLORS[8 + i]}	for i in range(8)}
+}
+
+def _sgr_style(state: dict):
+	fg, bg	= state["fg"], state["bg"]
+	if state["inverse"]:
+		fg, bg	= bg or "#ffffff", fg or "#000000"
+
+	style	= []
+	if fg is not None:		style.append("color: %s" % fg)
+	if bg is not None:		style.append("background-color: %s" % bg)
+	if state["bold"]:		style.append("font-weight: bold")
+	if state["italic"]:		style.append("font-style: italic")
+	return "; ".join(style)
+
+def iter_ansi_to_html(chunks: Iterable[str]):
+	state	= dict(_SGR_DEFAULTS)
+	opened	= False
+
+	def replace(match: re.Match):
+		nonlocal opened
+		for codes, command in _SGR_RE.findall(match.group(0)):
+			if command != "m":
+				continue
+			for code in codes.split(";"):
+				state.update(_SGR_SETTINGS.get(int(code) if code else 0, {}))
+
+		output	= "</span>" if opened else ""
+		style	= _sgr_style(state)
+		opened	= bool(style)
+		if opened:
+			output	+= '<span style="%s">' % style
+		return output
+
+	# The style carries over from one chunk to the next, but an escape may
+	# not be split between two chunks.
+	for chunk in chunks:
+		yield _SGR_RUN_RE.sub(replace, html.escape(chunk, False))
+	if opened:
+		yield "</span>"
+
+# Yields the lines of a string, with their line endings, one at a time; unlike
+# str.splitlines(), this does not build a list of all of them first.
+def iter_lines(text: str):
+	start	= 0
+	while start < len(text):
+		end		= text.find("\n", start) + 1 or len(text)
+		yield text[start:end]
+		start	= end
+
 # Support for extended fields
 @dataclasses.dataclass
 class GSField:
@@ -434,21 +546,13 @@ class GSField:
 	array_persons:	bool
 	type:			str
 
-	@property
+	@functools.cached_property
 	def spaced_name(self):
-		if hasattr(self, "_spaced_name"):
-			return self._spaced_name
-		else:
-			self._spaced_name	= convert_to_underscores(self.name, ' ')
-			return self._spaced_name
+		return convert_to_underscores(self.name, ' ')
 
-	@property
+	@functools.cached_property
 	def value_name(self):
-		if hasattr(self, "_value_name"):
-			return self._value_name
-		else:
-			self._value_name	= convert_to_underscores(self.name)
-			return self._value_name
+		return convert_to_underscores(self.name)
 
 	def has_field(self, person):
 		return hasattr(person, self.value_name)
@@ -473,10 +577,20 @@ EXTENDED_FIELDS:	list[GSField]	= [
 	)
 ]
 
+def _scan_fields(person):
+	return tuple(
+		field for field in EXTENDED_FIELDS if field.has_field(person)
+	)
+
+# The fields of a person are worked out once his document has been loaded (see
+# GSPerson.find_fields()); they are only scanned for here if that has not
+# happened. The stored fields are not updated if another document adds fields
+# while this person is still loaded, as happens when a file is opened without
+# closing the previous one.
 def all_fields_for_person(person):
-	for field in EXTENDED_FIELDS:
-		if field.has_field(person):
-			yield field
+	if person._fields is not None:
+		return person._fields
+	return _scan_fields(person)
 
 # MARK: Tree handling
 # ———————————————————————————
@@ -486,56 +600,51 @@ def setup_options():
 	global OPTIONS
 	global ASCII
 
-	OPTIONS = Graphics.LineDrawing(Graphics.Color.Foreground.YELLOW, ASCII)
+	OPTIONS = Graphics.LineDrawing.colorised(
+		Graphics.Color.Foreground.YELLOW,
+		ASCII
+	)
 
 setup_options()
 
 class Tree:
 	def __init__(self):
 		self.lst	: dict	= {}
-		self.data	: str	= ""
 
-	def _newlines(self, data, header):
-		return data.replace(
-			"\n",
-			"\n%s"%header
+	def _print(self, p: list, last=True, header=""):
+		# Nodes are laid out from an explicit stack, in the same order as a
+		# recursive walk would visit them. The prefix for a node's children
+		# only depends on the node itself, so it is built once and shared by
+		# all of them.
+		pipe, elbow, tee, blank	= (
+			OPTIONS.PIPE, OPTIONS.ELBOW, OPTIONS.TEE, OPTIONS.BLANK
 		)
 
-	def _print(self, p: list, last=True, header="", lastcall=False):
-		self.data += (
-			header
-			+ (OPTIONS.ELBOW if last else OPTIONS.TEE)
-			+ self._newlines(
-				str(p[0]),
-				(
-					header
-					+ (OPTIONS.BLANK if last else OPTIONS.PIPE)
-				)
-			)
-			+ "\n"
-		)
-		if len(p[1]) != 0:
-			children = p[1]
-			for i, c in enumerate(children):
-				self._print(
-					c,
-					last = (
-						i == len(children) - 1
-					),
-					header = (
-						header									\
-						+ (OPTIONS.BLANK if last else OPTIONS.PIPE)
-					),
-					lastcall = (
-						i == len(children) - 1 or last
-					)
-				)
-
+		stack	= [(p, last, header)]
+		while stack:
+			p, last, header	= stack.pop()
+			prefix			= header + (blank if last else pipe)
+
+			# The first line of a node is attached to the tree, and the rest
+			# are continued underneath it.
+			lines	= str(p[0]).split("\n")
+			yield header + (elbow if last else tee) + lines[0] + "\n"
+			for line in lines[1:]:
+				yield prefix + line + "\n"
+
+			children	= p[1]
+			for i in reversed(range(len(children))):
+				stack.append((
+					children[i],
+					i == len(children) - 1,
+					prefix
+				))
+
+	# Yields the tree one node at a time, so that the caller decides whether
+	# it needs to be held in memory as a whole.
 	def gen(self):
 		for each in self.lst:
-			self._print(each)
-
-		return self.data
+			yield from self._print(each)
 
 class Diagram:
 	def __init__(self):
@@ -543,59 +652,58 @@ class Diagram:
 		self.diagram    : str   = ""
 		self.ancestor	: bool	= True
 		self._treeobj   : Tree  = Tree()
+		self._info_cache: dict  = {}
 		self.__str__            = self.gen
 
 	@staticmethod
 	def colorise_bg(output, color=None):
-		output = output.split("\n")
-		output2 = []
-		output3 = ""
+		# Measure every line once, keeping the lengths for the padding.
+		lines	= []
+		longest	= 0
+		for line in output.split("\n"):
+			length	= actuallen(line)
+			lines.append((line, length))
+			longest	= max(longest, length)
+
+		colored	= color != Graphics.Color.Background.DEFAULT
+		start	= (
+			(Graphics.Color.Foreground.WHITE if colored else "")
+			+ color
+		)
+		end		= (
+			(Graphics.Color.Foreground.DEFAULT if colored else "")
+			+ Graphics.Color.Background.DEFAULT
+		)
 
-		longest = 0
-		for line in output:
-			longest = max(longest, actuallen(line))
-		
-		for line in output:
-			spaces = " " * (longest - actuallen(line))
-			output2.append(line + spaces)
-
-		for index, line in enumerate(output2):
-			output3 += (
-				(
-					"\n"
-					if index != 0
-					else ""
-				)
-				+ (
-					Graphics.Decoration.BOLD
-					if index == 0
-					else ""
-				)
-				+ (
-					Graphics.Color.Foreground.WHITE
-					if color != Graphics.Color.Background.DEFAULT
-					else ""
-				)
-				+ color
-				+ line
-				+ (
-					Graphics.Color.Foreground.DEFAULT
-					if color != Graphics.Color.Background.DEFAULT
-					else ""
-				)
-				+ Graphics.Color.Background.DEFAULT
-				+ (
-					Graphics.Decoration.RESETBOLD
-					if index == 0
-					else ""
-				)
-			)
-		
-		output = output3
+		output	= [
+			start + line + " " * (longest - length) + end
+			for line, length in lines
+		]
+		output[0]	= (
+			Graphics.Decoration.BOLD
+			+ output[0]
+			+ Graphics.Decoration.RESETBOLD
+		)
 
-		return output
+		return "\n".join(output)
 
 	def getinfo(self, person, rootness=100):
+		# The same person may appear many times in one diagram (for example,
+		# through shared ancestors), so blocks are cached. Only the root is
+		# rendered differently.
+		key		= (
+			person if isinstance(person, int) else person.id,
+			rootness == 0,
+			self.ancestor
+		)
+		if key in self._info_cache:
+			return self._info_cache[key]
+
+		output	= self._getinfo(person, rootness)
+		self._info_cache[key]	= output
+		return output
+
+	def _getinfo(self, person, rootness):
 		def get_id_fmt(ps):
 			return " " + fmt_id(ps, "", "")
 
@@ -649,37 +757,38 @@ class Diagram:
 		return output
 
 	def _convert(self, subdict, recurse=0):
-		list = []
-		for key in subdict.keys():
-			if subdict[key] is None:
-				list.append(
+		# This walks the tree with an explicit stack rather than recursing, so
+		# that very deep trees do not run into the recursion limit. Each entry
+		# holds a level of the tree, and the list its nodes are added to.
+		list	= []
+		stack	= [(subdict, list, recurse)]
+		while stack:
+			level, nodes, depth = stack.pop()
+			for key, value in level.items():
+				children	= []
+				nodes.append(
 					[
-						self.getinfo(key, recurse),
-						[]
-					]
-				)
-			else:
-				list.append(
-					[
-						self.getinfo(key, recurse),
-						self._convert(
-							subdict[key],
-							recurse+1
-						)
+						self.getinfo(key, depth),
+						children
 					]
 				)
+				if value is not None:
+					stack.append((value, children, depth+1))
 
 		return list
 
 	def gen(self):
 		self._treeobj.lst = self._convert(self.tree)
 
-		self.diagram = self._treeobj.gen()
+		self.diagram = "".join(self._treeobj.gen())
 		return self.diagram
 
 # Tree Database Functionality
 # ———————————————————————————
 
+# Names are converted once per field of every person, so the results are
+# cached.
+@functools.lru_cache(maxsize=None)
 def convert_to_underscores(name: str, sep="_"):
 	IRREGULAR_CONVERSIONS	= {
 		"ID":			"id"
@@ -708,8 +817,21 @@ class GSPerson:
 			setattr(self, convert_to_underscores(item), dictionary[item])
 
 		# Other things
-		self.parents	= [int(i) for i in self.parents.split(" ") if i]
+		self.parents	= tuple(int(i) for i in self.parents.split() if i)
 		self.gender		= resolve_gender(self.gender)
+		self._position	= None	# Set when the person is loaded.
+		self._fields	= None	# Set by find_fields().
+
+	# Finds the extended fields that this person has. This has to be done
+	# after all of the fields in the document have been read, as they may
+	# appear after the person.
+	def find_fields(self):
+		self._fields	= _scan_fields(self)
+
+	# The parents as a set, used to match siblings and for membership tests.
+	@functools.cached_property
+	def parents_set(self):
+		return frozenset(self.parents)
 
 	def profile(self):
 		return "".join([
@@ -762,30 +884,46 @@ class GSPerson:
 			]
 		])
 
+	# Parents are given in the order in which they appear in the file, and
+	# once each, whatever the order of the Parents line.
 	def get_parents(self):
-		arr	= []
-		for person in PERSONS:
-			if person.id in self.parents: arr.append(person)
-		return arr
+		return sorted(
+			[
+				PERSONS_BY_ID[tid]
+				for tid in dict.fromkeys(self.parents)
+				if tid in PERSONS_BY_ID
+			],
+			key = lambda person: person._position
+		)
 
 	def get_children(self):
-		arr	= []
-		for person in PERSONS:
-			if self.id in person.parents: arr.append(person)
-		return arr
+		return [PERSONS_BY_ID[tid] for tid in CHILDREN_OF.get(self.id, [])]
 	
 	def _gen_dict(self, person, fc=False):
-		current_dict 	= []
-		parents		= person.get_parents() if not fc else person.get_children()
-		current_dict.append(person.id)
-		if len(parents) == 0:
-			current_dict.append(None)
-		else:
-			subdict = {}
+		# As with Diagram._convert(), an explicit stack is used instead of
+		# recursion. Each entry holds a person, the container and key under
+		# which his relatives are to be stored, and the IDs of the persons on
+		# the path to him, so that a malformed file with a cycle in it is
+		# reported rather than walked forever.
+		current_dict	= [person.id, None]
+		stack			= [(person, current_dict, 1, frozenset([person.id]))]
+		while stack:
+			person, container, key, path = stack.pop()
+			parents	= person.get_parents() if not fc else person.get_children()
+			if len(parents) == 0:
+				continue
+
+			subdict			= {}
+			container[key]	= subdict
 			for parent in parents:
-				t = self._gen_dict(parent, fc)
-				subdict[t[0]] = t[1]
-			current_dict.append(subdict)
+				if parent.id in path:
+					raise RuntimeError(
+						"Cycle in family tree at person %d" % parent.id
+					)
+
+				subdict[parent.id]	= None
+				stack.append((parent, subdict, parent.id, path | {parent.id}))
+
 		return current_dict
 	
 	def ancestor_tree(self, backend=Diagram):
@@ -807,18 +945,15 @@ class GSPerson:
 	
 	@staticmethod
 	def by_id(tid):
-		for person in PERSONS:
-			if person.id == tid:
-				return person
-		return None
+		return PERSONS_BY_ID.get(tid)
 	
 	def get_siblings(self):
 		arr	= []
 		if not self.parents:				return arr
 
-		for person in PERSONS:
-			if person.id == self.id:			continue
-			if person.parents == self.parents:	arr.append(person)
+		for tid in SIBLINGS_OF.get(self.parents_set, []):
+			if tid == self.id:					continue
+			arr.append(PERSONS_BY_ID[tid])
 		return arr
 			
 	def get_spouses(self):
@@ -853,7 +988,20 @@ class GSFamilyTreeDocument:
 	def __postinit__(self):
 		global PERSONS
 		for person in self.persons:
+			person._position			= len(PERSONS)
 			PERSONS.append(person)
+			PERSONS_BY_ID[person.id]	= person
+			person.find_fields()
+
+		# Index each person under all of his parents, and under the set of
+		# them, so that children, siblings and spouses can be found without a
+		# scan.
+		for person in self.persons:
+			for tid in person.parents_set:
+				CHILDREN_OF.setdefault(tid, []).append(person.id)
+
+			if person.parents:
+				SIBLINGS_OF.setdefault(person.parents_set, []).append(person.id)
 
 class GSFamilyTreeDocumentINI(GSFamilyTreeDocument):
 	def __init__(self, filename: str):
@@ -921,8 +1069,6 @@ def push_cli_data(name: str, args: list, data: str):
 	diag(data)
 
 def query_list(args: list):
-	import re
-
 	person: GSPerson
 
 	def match(str1: re.Pattern, str2: str):
@@ -937,27 +1083,20 @@ def query_list(args: list):
 		if (len(args) + 1) % 3 != 0:
 			return "Bad arguments."
 	
-	def person_eligible_with_format(person: GSPerson, args):
-		# Old-style properties
-
-		if args[0] in {"title", "first name", "middle name", "last name"}:
-			ptrn	= re.compile(args[1])
-
-			if args[0] == "title":
-				if match(ptrn, person.title):
-					return True
-
-			elif args[0] == "first name":
-				if match(ptrn, person.first_name):
-					return True
+	OLD_STYLE_PROPERTIES	= {
+		"title":		"title",
+		"first name":	"first_name",
+		"middle name":	"middle_name",
+		"last name":	"last_name"
+	}
 
-			elif args[0] == "middle name":
-				if match(ptrn, person.middle_name):
-					return True
+	def person_eligible_with_format(person: GSPerson, args, ptrn: re.Pattern):
+		# Old-style properties
 
-			elif args[0] == "last name":
-				if match(ptrn, person.last_name):
-					return True
+		attribute	= OLD_STYLE_PROPERTIES.get(args[0])
+		if attribute is not None:
+			if match(ptrn, getattr(person, attribute)):
+				return True
 		
 		# if args[0] in {"children", "siblings", ""}
 			
@@ -967,7 +1106,7 @@ def query_list(args: list):
 		# New style 'extended values'
 
 		for field in EXTENDED_FIELDS:
-			if args[0] == field.spaced_name:
+			if args[0] == field.spaced_name and field.has_field(person):
 				if match(ptrn, field.extract(person)):
 					return True
 			
@@ -984,13 +1123,21 @@ def query_list(args: list):
 		CUR_ARGS.append(arg)
 
 	ARGS_NEW.append(CUR_ARGS)
+
+	# Every clause needs a property and a pattern to match it against.
+	for arg_set in ARGS_NEW:
+		if len(arg_set) < 2:
+			return "Bad arguments."
 	
 	for arg_set in ARGS_NEW:
 		old_matches	= MATCHES
 		MATCHES		= []
 
+		# The pattern is compiled once for the whole set of persons.
+		ptrn		= re.compile(arg_set[1])
+
 		for person in old_matches:
-			if person_eligible_with_format(person, arg_set):
+			if person_eligible_with_format(person, arg_set, ptrn):
 				MATCHES.append(person)
 
 	push_cli_data("list", args, table_format(MATCHES))
@@ -1050,6 +1197,9 @@ class CLICommands:
 		CLI.prompt = "GTREE"
 		CLI.file = None
 		PERSONS.clear()
+		PERSONS_BY_ID.clear()
+		CHILDREN_OF.clear()
+		SIBLINGS_OF.clear()
 
 	def help(args):
 		"""Display a help message."""
@@ -1058,24 +1208,8 @@ class CLICommands:
 		diag("Welcome to GTREE, a simple family tree program. This lists")
 		diag("all of the commands available to you from the program.\n")
 		FMT = "\033[1m{:>24}\033[0m: {}"
-		for command in dir(CLICommands):
-			# Private commands
-			if not (
-				command.startswith("_")
-				or (
-					command.startswith("__") 
-					and command.endswith("__")
-				)
-			):
-				diag(
-					FMT.format(
-						command,
-						getattr(
-							CLICommands,
-							command
-						).__doc__
-					)
-				)
+		for command, func in COMMAND_TABLE.items():
+			diag(FMT.format(command, func.__doc__))
 		diag("\nCopyright: Solomon Wood (C) 2024\nAll rights reserved.")
 
 	def exit(args):
@@ -1089,34 +1223,49 @@ class CLICommands:
 		"""Print the result of the last task to an HTML file."""
 		arguments	= parse_args(args, None, 1)
 		
-		if len(arguments[0]) == 0:
-			TYPE	= "standalone"
-		else:
-			TYPE	= arguments[0][0]
-		
-		if TYPE not in {"standalone", "inline"}:
-			return "Bad arguments."
+		TYPE		= "standalone"
+		USE_ANSI2HTML	= False
+		for option in arguments[0]:
+			if option in {"standalone", "inline"}:
+				TYPE	= option
+			elif option == "ansi2html":
+				USE_ANSI2HTML	= True
+			else:
+				return "Bad arguments."
+
+		if USE_ANSI2HTML and ansi2html is None:
+			return "The 'ansi2html' module is not installed."
 		
 		diag("Printing result of '%s'..." % (
 			Graphics.Decoration.BOLD + CLI._state_name + Graphics.Common.RESET
 		))
 
-		converter	= ansi2html.Ansi2HTMLConverter(
-			dark_bg		= False,
-			scheme		= "mint-terminal",
-			title		= CLI._state_name,
-			inline		= True
-		)
-		converted	= converter.convert(CLI._state_data, False)
+		if USE_ANSI2HTML:
+			converter	= ansi2html.Ansi2HTMLConverter(
+				dark_bg		= False,
+				scheme		= "mint-terminal",
+				title		= CLI._state_name,
+				inline		= True
+			)
+			converted	= [converter.convert(CLI._state_data, False)]
+		else:
+			converted	= iter_ansi_to_html(iter_lines(CLI._state_data))
 		
+		# The converted data is written line by line between the two halves
+		# of the template, rather than being substituted into it.
 		template	= STANDALONEHTML if TYPE == "standalone" else HTML
-		template	= template.replace("{Data}", converted)
-		template	= template.replace("{Title}", CLI._state_name)
-		template	= template.replace("{FamilyTreeName}", FILENAME)
-		template	+= "\n"
+		head, tail	= (
+			Template(part).substitute(
+				Title			= CLI._state_name,
+				FamilyTreeName	= FILENAME
+			)
+			for part in template.split("${Data}")
+		)
 
 		with open(arguments[1][0], "w") as file:
-			file.write(template)
+			file.write(head)
+			file.writelines(converted)
+			file.write(tail + "\n")
 		
 	def list(args):
 		"""List persons that match criteria."""
@@ -1157,6 +1306,15 @@ class CLICommands:
 		
 		push_cli_data("profile", args, person.profile())
 
+# The table of commands available from the command line, by name. Private
+# names (those starting with an underscore) are left out. It is sorted so that
+# the help command lists the commands in alphabetical order.
+COMMAND_TABLE	: dict	= {
+	name: getattr(CLICommands, name)
+	for name in sorted(vars(CLICommands))
+	if not name.startswith("_")
+}
+
 class CommandLineInterface:
 	def __init__(self):
 		self.status:		bool					= True
@@ -1209,13 +1367,10 @@ class CommandLineInterface:
 		
 		commandname	= cmd[0]
 		alsocmd		= cmd[1:]
-		try:
-			func		= getattr(CLICommands, commandname)
-		except AttributeError:
-			func		= None
-			ret			= "Currently unavailable"
+		func		= COMMAND_TABLE.get(commandname)
 
-		if func is not None: ret = func(alsocmd)
+		if func is not None:	ret = func(alsocmd)
+		else:					ret = "Currently unavailable"
 		if ret != 0 and ret is not None:
 			diag("Command %s raised an error: %s"%(
 				commandname,